@@ -5,13 +5,27 @@ Provides interactive monitoring with built-in commands
 """
 
 import serial
+from serial.tools import list_ports
+import selectors
 import threading
 import time
 import sys
 import signal
 import glob
 import os
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# USB IDs of a Pico running firmware with USB stdio
+PICO_VID = 0x2E8A  # Raspberry Pi
+PICO_RUNTIME_PID = 0x000A  # Pico CDC
+
+# Set by the SIGINT handler; every monitor loop exits once it is set
+_STOP = threading.Event()
+
+def _handle_sigint(sig, frame):
+    """Request a graceful shutdown of the monitor"""
+    print("\n🛑 Received interrupt signal")
+    _STOP.set()
 
 class PicoMonitor:
     def __init__(self, port=None, baudrate=115200):
@@ -19,20 +33,60 @@ class PicoMonitor:
         self.port = port or self.find_pico_port()
         self.serial_conn = None
         self.running = False
-        self.monitor_thread = None
+        self.selector = None
         self.command_history = []
+        self._rx_buffer = bytearray()
+        self._stdin_buffer = bytearray()
+        self._last_sec = -1
+        self._last_stamp = ''
         
     def find_pico_port(self):
-        """Find the first available Pico serial port"""
-        possible_ports = glob.glob('/dev/ttyACM*') + glob.glob('/dev/ttyUSB*')
+        """Find the first Pico serial port by USB VID/PID"""
+        # Match on USB IDs rather than opening ports, which can reset the target
+        ports = list_ports.comports()
+        port = next(
+            (p.device for p in ports
+             if p.vid == PICO_VID and p.pid == PICO_RUNTIME_PID),
+            None
+        )
+        if port:
+            return port
         
-        for port in possible_ports:
-            try:
-                # Try to open the port briefly to check if it's accessible
-                with serial.Serial(port, self.baudrate, timeout=0.1):
-                    return port
-            except (serial.SerialException, PermissionError):
-                continue
+        # Then any other Raspberry Pi device, e.g. MicroPython (2E8A:0005)
+        port = next((p.device for p in ports if p.vid == PICO_VID), None)
+        if port:
+            return port
+        
+        # Fall back to probing ports that carry no USB metadata
+        identified = {p.device for p in ports if p.vid is not None}
+        candidates = [
+            p for p in glob.glob('/dev/ttyACM*') + glob.glob('/dev/ttyUSB*')
+            if p not in identified
+        ]
+        return self._probe_ports(candidates)
+    
+    def _probe_port(self, port):
+        """Check whether a serial port can be opened"""
+        try:
+            with serial.Serial(port, self.baudrate, timeout=0.1):
+                return True
+        except (serial.SerialException, PermissionError):
+            return False
+    
+    def _probe_ports(self, ports):
+        """Probe candidate ports concurrently and return the first that opens"""
+        if not ports:
+            return None
+        
+        executor = ThreadPoolExecutor(max_workers=min(len(ports), 8))
+        try:
+            futures = {executor.submit(self._probe_port, p): p for p in ports}
+            for future in as_completed(futures):
+                if future.result():
+                    return futures[future]
+        finally:
+            # Don't wait on probes that are still pending once we have a port
+            executor.shutdown(wait=False, cancel_futures=True)
         
         return None
     
@@ -65,13 +119,19 @@ class PicoMonitor:
     
     def disconnect(self):
         """Disconnect from the Pico"""
-        self.running = False
-        if self.monitor_thread and self.monitor_thread.is_alive():
-            self.monitor_thread.join(timeout=1.0)
+        if not self.serial_conn:
+            return
         
-        if self.serial_conn and self.serial_conn.is_open:
+        # A closed port has no fileno(), and can no longer be registered anyway
+        if self.serial_conn.is_open:
+            if self.selector:
+                try:
+                    self.selector.unregister(self.serial_conn)
+                except (KeyError, ValueError):
+                    pass
             self.serial_conn.close()
             print(f"\n📤 Disconnected from {self.port}")
+        self.serial_conn = None
     
     def send_command(self, command):
         """Send a command to the Pico"""
@@ -90,21 +150,51 @@ class PicoMonitor:
             return False
     
     def read_from_pico(self):
-        """Read data from Pico in a separate thread"""
-        while self.running and self.serial_conn and self.serial_conn.is_open:
-            try:
-                if self.serial_conn.in_waiting > 0:
-                    data = self.serial_conn.readline().decode('utf-8', errors='ignore').strip()
-                    if data:
-                        timestamp = datetime.now().strftime("%H:%M:%S")
-                        print(f"📥 [{timestamp}] {data}")
-                else:
-                    time.sleep(0.01)  # Small delay to prevent busy waiting
-            except serial.SerialException:
-                break
-            except UnicodeDecodeError:
-                # Handle any encoding issues
-                continue
+        """Drain all data currently available from the Pico"""
+        # After a hangup in_waiting (TIOCINQ) raises a raw OSError(EIO) that
+        # pyserial does not wrap; report it like any other port failure
+        try:
+            n = self.serial_conn.in_waiting
+        except OSError as e:
+            raise serial.SerialException(f"device disconnected: {e}") from e
+        chunk = self.serial_conn.read(n or 1)
+        if b'\n' not in chunk:
+            self._rx_buffer += chunk
+            return
+        accum = self._rx_buffer
+        accum += chunk
+        end = accum.rfind(b'\n') + 1
+
+        # Only reformat the timestamp when the second rolls over
+        sec = int(time.time())
+        if sec != self._last_sec:
+            self._last_sec = sec
+            self._last_stamp = time.strftime("%H:%M:%S", time.localtime(sec))
+
+        # Decode complete lines straight out of the accumulator
+        out = bytearray()
+        start = 0
+        with memoryview(accum) as view:
+            while start < end:
+                nl = accum.index(b'\n', start, end)
+                data = str(view[start:nl], 'utf-8', 'ignore').rstrip('\r\n')
+                start = nl + 1
+                if data:
+                    out += f"📥 [{self._last_stamp}] {data}\n".encode('utf-8')
+
+        # Keep the trailing partial line for the next read
+        del accum[:end]
+        if out:
+            self._write_stdout(out)
+    
+    def _write_stdout(self, data):
+        """Write a whole batch to stdout with raw os.write calls"""
+        # Push out anything print() still has buffered to keep output ordered
+        sys.stdout.flush()
+        fd = sys.stdout.fileno()
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
     
     def print_help(self):
         """Print available monitor commands"""
@@ -159,66 +249,47 @@ class PicoMonitor:
         if not self.connect():
             return
         
-        # Set up signal handler for graceful exit
-        def signal_handler(sig, frame):
-            print("\n🛑 Received interrupt signal")
-            self.running = False
-        
-        signal.signal(signal.SIGINT, signal_handler)
-        
-        # Start monitoring thread
         self.running = True
-        self.monitor_thread = threading.Thread(target=self.read_from_pico, daemon=True)
-        self.monitor_thread.start()
+        wakeup_r = wakeup_w = None
+        old_wakeup_fd = None
         
-        # Interactive command loop
         try:
-            while self.running:
+            # Multiplex serial data, keyboard input and signals on one selector
+            self.selector = selectors.DefaultSelector()
+            self.selector.register(self.serial_conn, selectors.EVENT_READ, 'serial')
+            
+            # epoll refuses regular files and /dev/null; those never block, so
+            # they are read directly on every loop iteration instead
+            try:
+                self.selector.register(sys.stdin, selectors.EVENT_READ, 'stdin')
+                stdin_pollable = True
+            except (PermissionError, ValueError):
+                stdin_pollable = False
+            
+            # Signals write to this pipe, so SIGINT wakes the select() call
+            wakeup_r, wakeup_w = os.pipe()
+            os.set_blocking(wakeup_r, False)
+            os.set_blocking(wakeup_w, False)
+            old_wakeup_fd = signal.set_wakeup_fd(wakeup_w)
+            self.selector.register(wakeup_r, selectors.EVENT_READ, 'signal')
+            
+            # Interactive event loop
+            while self.running and not _STOP.is_set():
                 try:
-                    command = input().strip()
-                    
-                    if not command:
-                        continue
+                    timeout = None if stdin_pollable else 0
+                    for key, _ in self.selector.select(timeout=timeout):
+                        if key.data == 'serial':
+                            self._on_serial_ready()
+                        elif key.data == 'signal':
+                            # Drain the wakeup bytes; the handler already set _STOP
+                            os.read(wakeup_r, 512)
+                        elif not self._on_stdin_ready():
+                            self.running = False
+                            break
                     
-                    # Handle monitor commands (lowercase)
-                    cmd_lower = command.lower()
-                    
-                    if cmd_lower in ['quit', 'exit', 'q']:
-                        print("👋 Exiting monitor...")
-                        break
-                    
-                    elif cmd_lower in ['help', '?']:
-                        self.print_help()
-                    
-                    elif cmd_lower in ['clear', 'cls']:
-                        os.system('clear' if os.name == 'posix' else 'cls')
-                    
-                    elif cmd_lower == 'status':
-                        self.print_status()
-                    
-                    elif cmd_lower == 'history':
-                        print(f"\n📝 Command History ({len(self.command_history)} commands):")
-                        for i, cmd in enumerate(self.command_history[-10:], 1):
-                            print(f"   {i:2d}. {cmd}")
-                        print("")
-                    
-                    elif cmd_lower == 'reconnect':
-                        print("🔄 Reconnecting...")
-                        self.disconnect()
-                        time.sleep(1)
-                        if self.connect():
-                            self.running = True
-                            self.monitor_thread = threading.Thread(target=self.read_from_pico, daemon=True)
-                            self.monitor_thread.start()
-                    
-                    else:
-                        # Send command to Pico
-                        self.send_command(command)
+                    if self.running and not stdin_pollable and not self._on_stdin_ready():
+                        self.running = False
                 
-                except EOFError:
-                    # Handle Ctrl+D
-                    print("\n👋 EOF received, exiting...")
-                    break
                 except KeyboardInterrupt:
                     # Handle Ctrl+C
                     print("\n👋 Interrupt received, exiting...")
@@ -226,7 +297,89 @@ class PicoMonitor:
         
         finally:
             self.running = False
+            if old_wakeup_fd is not None:
+                signal.set_wakeup_fd(old_wakeup_fd)
+            self.disconnect()
+            if self.selector:
+                self.selector.close()
+                self.selector = None
+            if wakeup_r is not None:
+                os.close(wakeup_r)
+                os.close(wakeup_w)
+    
+    def _on_serial_ready(self):
+        """Handle serial readiness, dropping the port if the device went away"""
+        try:
+            self.read_from_pico()
+        except serial.SerialException as e:
+            self.selector.unregister(self.serial_conn)
+            print(f"❌ Serial connection lost: {e}")
+            print("💡 Type 'reconnect' to reconnect")
+    
+    def _on_stdin_ready(self):
+        """Read available input and dispatch complete lines; returns False to exit"""
+        # A single os.read never blocks after readiness and, unlike
+        # sys.stdin.readline(), leaves no lines hidden in a Python buffer
+        chunk = os.read(sys.stdin.fileno(), 4096)
+        if not chunk:
+            # Handle Ctrl+D, running any unterminated final line first
+            if self._stdin_buffer.strip():
+                self._stdin_buffer += b'\n'
+                if not self._dispatch_input_lines():
+                    return False
+            print("\n👋 EOF received, exiting...")
+            return False
+        
+        self._stdin_buffer += chunk
+        return self._dispatch_input_lines()
+    
+    def _dispatch_input_lines(self):
+        """Dispatch each complete buffered input line; returns False to exit"""
+        *lines, partial = self._stdin_buffer.split(b'\n')
+        self._stdin_buffer = partial
+        for line in lines:
+            command = line.decode('utf-8', errors='ignore').strip()
+            if command and not self.handle_command(command):
+                return False
+        return True
+    
+    def handle_command(self, command):
+        """Handle a monitor command or send it to the Pico; returns False to exit"""
+        # Handle monitor commands (lowercase)
+        cmd_lower = command.lower()
+        
+        if cmd_lower in ['quit', 'exit', 'q']:
+            print("👋 Exiting monitor...")
+            return False
+        
+        elif cmd_lower in ['help', '?']:
+            self.print_help()
+        
+        elif cmd_lower in ['clear', 'cls']:
+            os.system('clear' if os.name == 'posix' else 'cls')
+        
+        elif cmd_lower == 'status':
+            self.print_status()
+        
+        elif cmd_lower == 'history':
+            print(f"\n📝 Command History ({len(self.command_history)} commands):")
+            for i, cmd in enumerate(self.command_history[-10:], 1):
+                print(f"   {i:2d}. {cmd}")
+            print("")
+        
+        elif cmd_lower == 'reconnect':
+            print("🔄 Reconnecting...")
             self.disconnect()
+            time.sleep(1)
+            self._rx_buffer.clear()
+            if self.connect():
+                self.selector.register(self.serial_conn, selectors.EVENT_READ, 'serial')
+        
+        else:
+            # Send command to Pico
+            self.send_command(command)
+        
+        return True
 
 def main():
     """Main entry point"""
@@ -239,12 +392,20 @@ def main():
     
     args = parser.parse_args()
     
+    # Install the interrupt handler once for the whole process
+    signal.signal(signal.SIGINT, _handle_sigint)
+    
     if args.list_ports:
         print("📱 Available serial ports:")
-        ports = glob.glob('/dev/ttyACM*') + glob.glob('/dev/ttyUSB*')
+        ports = sorted(list_ports.comports(), key=lambda p: p.device)
         if ports:
             for port in ports:
-                print(f"   {port}")
+                if port.vid is None:
+                    print(f"   {port.device}")
+                    continue
+                marker = " (Pico)" if port.vid == PICO_VID and port.pid == PICO_RUNTIME_PID else ""
+                print(f"   {port.device}  VID:PID={port.vid:04X}:{port.pid:04X}  "
+                      f"serial={port.serial_number or '-'}{marker}")
         else:
             print("   No serial ports found")
         return
@@ -20,6 +20,9 @@ import time
 import argparse
 import subprocess
 import threading
+import signal
+import queue
+import mmap
 from pathlib import Path
 import logging
 from typing import Optional, List, Tuple
@@ -32,9 +35,15 @@ except ImportError:
     USB_AVAILABLE = False
     print("Warning: pyusb not available. USB reset functionality disabled.")
 
+try:
+    import usb1
+    HOTPLUG_AVAILABLE = True
+except ImportError:
+    HOTPLUG_AVAILABLE = False
+
 try:
     from watchdog.observers import Observer
-    from watchdog.events import FileSystemEventHandler
+    from watchdog.events import PatternMatchingEventHandler
     WATCHDOG_AVAILABLE = True
 except ImportError:
     WATCHDOG_AVAILABLE = False
@@ -53,6 +62,16 @@ PICO_VID = 0x2E8A  # Raspberry Pi
 PICO_BOOTLOADER_PID = 0x0003  # RP2 Boot
 PICO_RUNTIME_PID = 0x000A     # Pico CDC
 
+# Seconds a USB device scan stays valid before re-enumerating
+DEVICE_CACHE_TTL = 0.25
+
+# UF2 images are a sequence of 512-byte blocks; copy them 64 blocks at a time
+UF2_BLOCK_SIZE = 512
+UF2_WRITE_CHUNK = UF2_BLOCK_SIZE * 64
+
+# Seconds without source changes before watch mode starts a build
+BUILD_QUIET_PERIOD = 0.3
+
 class PicoDevice:
     """Represents a connected Pico device"""
     
@@ -66,9 +85,16 @@ class PicoFlasher:
     def __init__(self):
         self.project_root = Path(__file__).parent.parent
         self.build_dir = self.project_root / "examples" / "c" / "build"
+        self._dev_cache: Tuple[float, List[PicoDevice]] = (0.0, [])
+        self._picotool_execute: Optional[bool] = None
         
     def find_pico_devices(self) -> List[PicoDevice]:
         """Find all connected Pico devices"""
+        # Reuse a recent scan to avoid walking the libusb device tree repeatedly
+        cached_at, cached_devices = self._dev_cache
+        if time.monotonic() - cached_at < DEVICE_CACHE_TTL:
+            return list(cached_devices)
+            
         devices = []
         
         if not USB_AVAILABLE:
@@ -76,29 +102,16 @@ class PicoFlasher:
             return self._find_devices_picotool()
         
         try:
-            # Find bootloader devices
-            bootloader_devices = usb.core.find(
-                find_all=True,
-                idVendor=PICO_VID,
-                idProduct=PICO_BOOTLOADER_PID
-            )
-            
-            for dev in bootloader_devices:
-                devices.append(PicoDevice('bootloader', {
-                    'vendor_id': dev.idVendor,
-                    'product_id': dev.idProduct,
-                    'device': dev
-                }))
-                
-            # Find runtime devices
-            runtime_devices = usb.core.find(
-                find_all=True,
-                idVendor=PICO_VID,
-                idProduct=PICO_RUNTIME_PID
-            )
-            
-            for dev in runtime_devices:
-                devices.append(PicoDevice('runtime', {
+            # Single pass over all Raspberry Pi devices, dispatched on PID
+            for dev in usb.core.find(find_all=True, idVendor=PICO_VID):
+                if dev.idProduct == PICO_BOOTLOADER_PID:
+                    device_type = 'bootloader'
+                elif dev.idProduct == PICO_RUNTIME_PID:
+                    device_type = 'runtime'
+                else:
+                    continue
+                    
+                devices.append(PicoDevice(device_type, {
                     'vendor_id': dev.idVendor,
                     'product_id': dev.idProduct,
                     'device': dev
@@ -108,6 +121,7 @@ class PicoFlasher:
             logger.error(f"USB device detection failed: {e}")
             return self._find_devices_picotool()
             
+        self._dev_cache = (time.monotonic(), devices)
         return devices
     
     def _find_devices_picotool(self) -> List[PicoDevice]:
@@ -206,6 +220,15 @@ class PicoFlasher:
         
         logger.info(f"Waiting {timeout} seconds for bootloader mode...")
         
+        # Prefer libusb hotplug events; fall back to polling if unsupported
+        detected = self._wait_for_bootloader_hotplug(timeout)
+        if detected is not None:
+            if detected:
+                logger.info("Bootloader mode detected!")
+                return True
+            logger.error("Timeout waiting for bootloader mode")
+            return False
+        
         for i in range(timeout):
             if self._check_bootloader_mode():
                 logger.info("Bootloader mode detected!")
@@ -217,6 +240,52 @@ class PicoFlasher:
         logger.error("Timeout waiting for bootloader mode")
         return False
     
+    def _wait_for_bootloader_hotplug(self, timeout: int) -> Optional[bool]:
+        """Block on a libusb hotplug event for the bootloader device.
+        
+        Returns None if hotplug is not supported on this platform.
+        """
+        if not HOTPLUG_AVAILABLE:
+            return None
+            
+        try:
+            with usb1.USBContext() as context:
+                if not context.hasCapability(usb1.CAP_HAS_HOTPLUG):
+                    return None
+                    
+                arrived = threading.Event()
+                
+                def on_hotplug(context, device, event):
+                    arrived.set()
+                    return True  # Deregister after the first arrival
+                
+                # ENUMERATE also fires for a device that is already attached
+                context.hotplugRegisterCallback(
+                    on_hotplug,
+                    events=usb1.HOTPLUG_EVENT_DEVICE_ARRIVED,
+                    flags=usb1.HOTPLUG_ENUMERATE,
+                    vendor_id=PICO_VID,
+                    product_id=PICO_BOOTLOADER_PID
+                )
+                
+                deadline = time.monotonic() + timeout
+                while not arrived.is_set():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    print(f"Still waiting... ({int(remaining)}s remaining)")
+                    context.handleEventsTimeout(tv=min(5, remaining))
+                    
+        except usb1.USBError as e:
+            logger.debug(f"libusb hotplug unavailable: {e}")
+            return None
+            
+        if arrived.is_set():
+            # Drop any cached scan taken before the device appeared
+            self._dev_cache = (0.0, [])
+            return True
+        return False
+    
     def flash_firmware(self, uf2_file: Path) -> bool:
         """Flash firmware to Pico"""
         if not uf2_file.exists():
@@ -227,15 +296,27 @@ class PicoFlasher:
         logger.info(f"File size: {uf2_file.stat().st_size / 1024:.1f} KB")
         
         try:
+            # Load and execute in one picotool process when supported
+            if self._picotool_supports_execute():
+                returncode, errors = self._run_streamed(
+                    ['picotool', 'load', '-x', str(uf2_file)],
+                    timeout=30
+                )
+                
+                if returncode == 0:
+                    logger.info("Firmware loaded and started successfully")
+                    return True
+                else:
+                    logger.error(f"Flash failed: {errors}")
+                    return False
+            
             # Flash using picotool
-            result = subprocess.run(
+            returncode, errors = self._run_streamed(
                 ['picotool', 'load', str(uf2_file)],
-                capture_output=True,
-                text=True,
                 timeout=30
             )
             
-            if result.returncode == 0:
+            if returncode == 0:
                 logger.info("Firmware loaded successfully")
                 
                 # Reboot to run firmware
@@ -252,15 +333,135 @@ class PicoFlasher:
                     
                 return True
             else:
-                logger.error(f"Flash failed: {result.stderr}")
+                logger.error(f"Flash failed: {errors}")
                 return False
                 
         except subprocess.TimeoutExpired:
             logger.error("Flash operation timed out")
             return False
         except FileNotFoundError:
-            logger.error("picotool not found")
+            # Fall back to copying onto the BOOTSEL mass-storage drive
+            drive = self._find_uf2_drive()
+            if drive is None:
+                logger.error("picotool not found and no RPI-RP2 drive mounted")
+                return False
+            return self._flash_uf2_drive(uf2_file, drive)
+    
+    def _find_uf2_drive(self) -> Optional[Path]:
+        """Locate a mounted RPI-RP2 bootloader drive"""
+        candidates = [Path('/Volumes/RPI-RP2')]
+        for media_root in ('/media', '/run/media'):
+            candidates.extend(Path(media_root).glob('*/RPI-RP2'))
+            
+        for drive in candidates:
+            if (drive / 'INFO_UF2.TXT').exists():
+                return drive
+        return None
+    
+    def _flash_uf2_drive(self, uf2_file: Path, drive: Path) -> bool:
+        """Copy a UF2 image onto the bootloader drive straight from an mmap"""
+        logger.info(f"Copying firmware to {drive}")
+        
+        try:
+            with open(uf2_file, 'rb') as src, \
+                    open(drive / uf2_file.name, 'wb', buffering=0) as dst:
+                with mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    view = memoryview(mm)
+                    try:
+                        # Write whole UF2 blocks without an intermediate bytes copy;
+                        # raw FileIO may write short, so advance by what was written
+                        offset = 0
+                        while offset < len(view):
+                            written = dst.write(view[offset:offset + UF2_WRITE_CHUNK])
+                            if not written:
+                                raise OSError(f"write stalled at byte {offset}")
+                            offset += written
+                    finally:
+                        view.release()
+                os.fsync(dst.fileno())
+        except (OSError, ValueError) as e:
+            logger.error(f"Copy to {drive} failed: {e}")
             return False
+            
+        logger.info("Firmware copied, Pico will reboot automatically")
+        return True
+    
+    def _run_streamed(self, cmd: List[str], timeout: float,
+                      cwd: Optional[Path] = None) -> Tuple[int, str]:
+        """Run a command, streaming its output to the debug log.
+        
+        Returns the exit code and the complete stderr for error reports.
+        """
+        errors: List[str] = []
+        with subprocess.Popen(
+            cmd,
+            cwd=cwd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+            # Own process group, so recipe shells and compilers can be killed too
+            start_new_session=(os.name == 'posix')
+        ) as proc:
+            timed_out = threading.Event()
+            
+            def kill_tree():
+                # Children inherit the output pipes; the readers only finish
+                # once every one of them is gone
+                if os.name == 'posix':
+                    try:
+                        os.killpg(proc.pid, signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+                else:
+                    proc.kill()
+            
+            def on_timeout():
+                timed_out.set()
+                kill_tree()
+            
+            def read_stderr():
+                for line in proc.stderr:
+                    line = line.rstrip()
+                    logger.debug(line)
+                    errors.append(line)
+            
+            # Drain stderr on a helper thread so neither pipe can fill up
+            stderr_reader = threading.Thread(target=read_stderr, daemon=True)
+            stderr_reader.start()
+            timer = threading.Timer(timeout, on_timeout)
+            timer.start()
+            try:
+                for line in proc.stdout:
+                    logger.debug(line.rstrip())
+                stderr_reader.join()
+                returncode = proc.wait()
+            except BaseException:
+                # The new session doesn't see Ctrl+C; don't leave the build running
+                kill_tree()
+                raise
+            finally:
+                timer.cancel()
+                
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        return returncode, '\n'.join(errors)
+    
+    def _picotool_supports_execute(self) -> bool:
+        """Check once whether 'picotool load' accepts -x (execute after load)"""
+        if self._picotool_execute is None:
+            try:
+                result = subprocess.run(
+                    ['picotool', 'help', 'load'],
+                    capture_output=True,
+                    text=True,
+                    timeout=5
+                )
+                self._picotool_execute = '--execute' in result.stdout
+            except (subprocess.TimeoutExpired, FileNotFoundError):
+                self._picotool_execute = False
+            logger.debug(f"picotool load -x supported: {self._picotool_execute}")
+        return self._picotool_execute
     
     def verify_flash(self) -> bool:
         """Verify flash operation by checking device state"""
@@ -280,8 +481,8 @@ class PicoFlasher:
             logger.warning("⚠️ Pico not detected after flashing")
             return False
     
-    def compile_and_flash(self, target: str = "blinky") -> bool:
-        """Compile target and flash to Pico"""
+    def compile_and_flash(self, target: str = "blinky", clean: bool = False) -> bool:
+        """Compile target and flash to Pico (incremental unless clean is set)"""
         logger.info(f"Compiling {target}...")
         
         if not self.build_dir.exists():
@@ -289,24 +490,18 @@ class PicoFlasher:
             return False
             
         try:
-            # Change to build directory
-            original_dir = os.getcwd()
-            os.chdir(self.build_dir)
-            
-            # Clean build
-            subprocess.run(['make', 'clean'], capture_output=True)
+            # Clean build only on request; otherwise make rebuilds what changed
+            if clean:
+                subprocess.run(['make', 'clean'], cwd=self.build_dir, capture_output=True)
             
             # Build
-            result = subprocess.run(
-                ['make', '-j4'],
-                capture_output=True,
-                text=True,
-                timeout=120
+            returncode, errors = self._run_streamed(
+                ['make', f'-j{os.cpu_count() or 1}'],
+                timeout=120,
+                cwd=self.build_dir
             )
             
-            os.chdir(original_dir)
-            
-            if result.returncode == 0:
+            if returncode == 0:
                 logger.info("Compilation successful")
                 uf2_file = self.build_dir / f"{target}.uf2"
                 
@@ -316,7 +511,7 @@ class PicoFlasher:
                     logger.error(f"UF2 file not generated: {uf2_file}")
                     return False
             else:
-                logger.error(f"Compilation failed: {result.stderr}")
+                logger.error(f"Compilation failed:\n{errors}")
                 return False
                 
         except subprocess.TimeoutExpired:
@@ -365,37 +560,62 @@ class PicoFlasher:
             logger.error("❌ Flash operation failed")
             return False
 
-class SourceFileHandler(FileSystemEventHandler):
+class SourceFileHandler(PatternMatchingEventHandler):
     """File system event handler for watch mode"""
     
-    def __init__(self, flasher: PicoFlasher, target: str):
+    def __init__(self, flasher: PicoFlasher, target: str, clean: bool = False):
+        # Only C/C++ sources reach on_modified; other events are filtered out
+        super().__init__(
+            patterns=['*.c', '*.cpp', '*.h', '*.hpp'],
+            ignore_directories=True
+        )
         self.flasher = flasher
         self.target = target
-        self.last_build = 0
+        self.clean = clean
+        self._last_event = 0.0
+        self._lock = threading.Lock()
+        
+        # One long-lived worker serializes builds; a single queue slot
+        # collapses any number of pending change notifications into one
+        self._queue: queue.Queue = queue.Queue(maxsize=1)
+        threading.Thread(target=self._worker, daemon=True).start()
         
     def on_modified(self, event):
-        if event.is_directory:
-            return
-            
-        # Only trigger on C/C++ source files
-        if event.src_path.endswith(('.c', '.cpp', '.h', '.hpp')):
-            current_time = time.time()
+        logger.info(f"Source file changed: {event.src_path}")
+        
+        with self._lock:
+            self._last_event = time.monotonic()
+        try:
+            self._queue.put_nowait(True)
+        except queue.Full:
+            pass  # A build is already pending
+    
+    def _worker(self):
+        """Build loop: wait for a change, let the burst settle, then build"""
+        while True:
+            self._queue.get()
             
-            # Debounce: only build if 2 seconds have passed
-            if current_time - self.last_build > 2:
-                self.last_build = current_time
-                logger.info(f"Source file changed: {event.src_path}")
-                
-                # Run compilation and flash in separate thread
-                threading.Thread(
-                    target=self._compile_and_flash_thread,
-                    daemon=True
-                ).start()
-    
-    def _compile_and_flash_thread(self):
-        """Thread function for compilation and flashing"""
+            # Coalesce bursts: only build once no event arrived for the quiet period
+            while True:
+                with self._lock:
+                    wait = self._last_event + BUILD_QUIET_PERIOD - time.monotonic()
+                if wait <= 0:
+                    break
+                time.sleep(wait)
+
+            # Drop the token queued by later events of this same burst; events
+            # arriving during the build still queue one follow-up build
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+
+            self._compile_and_flash()
+    
+    def _compile_and_flash(self):
+        """Compile and flash once, logging the outcome"""
         try:
-            if self.flasher.compile_and_flash(self.target):
+            if self.flasher.compile_and_flash(self.target, self.clean):
                 logger.info("🎉 Auto-flash completed successfully")
             else:
                 logger.error("❌ Auto-flash failed")
@@ -412,6 +632,7 @@ Examples:
   %(prog)s                          # Flash default blinky.uf2
   %(prog)s -f custom.uf2           # Flash specific file
   %(prog)s -c -t temperature       # Compile and flash temperature example
+  %(prog)s -c --clean              # Clean rebuild before flashing
   %(prog)s -w                      # Watch mode for automatic flashing
         """
     )
@@ -434,6 +655,12 @@ Examples:
         help='Target name to compile (default: blinky)'
     )
     
+    parser.add_argument(
+        '--clean',
+        action='store_true',
+        help='Run make clean before compiling (default: incremental build)'
+    )
+    
     parser.add_argument(
         '-w', '--watch',
         action='store_true',
@@ -464,7 +691,7 @@ Examples:
         logger.info(f"Target: {args.target}")
         logger.warning("Press Ctrl+C to stop")
         
-        event_handler = SourceFileHandler(flasher, args.target)
+        event_handler = SourceFileHandler(flasher, args.target, args.clean)
         observer = Observer()
         observer.schedule(
             event_handler,
@@ -484,7 +711,7 @@ Examples:
     
     # Compile mode
     if args.compile:
-        success = flasher.compile_and_flash(args.target)
+        success = flasher.compile_and_flash(args.target, args.clean)
         return 0 if success else 1
     
     # Flash mode